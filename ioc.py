@@ -3,8 +3,10 @@
 PCASpy application for Hamamatsu MCD C7557-1
 """
 import h5py
+import logging
 import numpy
 import os
+import signal
 import time
 import threading
 
@@ -12,6 +14,7 @@ from pcaspy import Driver, SimpleServer, Severity
 from pcaspy.tools import ServerThread
 
 from hamamatsu import HamamatsuMCD
+from shmframe import FrameWriter
 
 pvdb = {
     # acquisition control and status
@@ -58,11 +61,15 @@ pvdb = {
 
 
 class HamamatsuMCDriver(Driver):
-    def __init__(self):
+    def __init__(self, shm=None):
         Driver.__init__(self)
         self.tid = None
         self.images = None
         self.mcd = HamamatsuMCD()
+        # optional shared memory export for consumers on the same host
+        self.frames = None
+        if shm:
+            self.frames = FrameWriter(shm, slot_size=pvdb['ArrayData']['count'])
 
     def write(self, reason, value):
         status = True
@@ -123,6 +130,12 @@ class HamamatsuMCDriver(Driver):
             self.setParam('NumExposuresCounter_RBV', cycle + 1)
             self.updatePVs()
 
+            if self.frames is not None:
+                try:
+                    self.frames.write(self.images)
+                except ValueError as e:
+                    logging.warning('shared memory export failed: %s', e)
+
             if auto_save:
                 self.setParam('DetectorState_RBV', 2)
                 if cycle == 0:
@@ -172,26 +185,42 @@ if __name__ == '__main__':
                     help='EPICS PVs prefix')
     parser.add_argument('--gui', action='store_true', default=False,
                     help='start QtQuick GUI')
+    parser.add_argument('--shm', metavar='NAME',
+                    help='also export frames to shared memory NAME')
     args = parser.parse_args()
 
     server = SimpleServer()
     server.createPV(args.prefix, pvdb)
-    driver = HamamatsuMCDriver()
-
-    if args.gui:
-        server_thread = ServerThread(server)
-        server_thread.start()
-
-        from PyQt5 import QtCore, QtGui, QtQuick
-        app = QtGui.QGuiApplication(sys.argv)
-        view = QtQuick.QQuickView()
-        view.setResizeMode(QtQuick.QQuickView.SizeRootObjectToView)
-        view.setSource(QtCore.QUrl.fromLocalFile('mcd.qml'))
-        view.setTitle('Hamamatsu C7557-1 Control')
-        view.show()
-
-        app.lastWindowClosed.connect(server_thread.stop)
-        app.exec_()
-    else:
-        while True:
-            server.process(0.1)
+    driver = HamamatsuMCDriver(args.shm)
+
+    # shut down the same way on kill as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        if args.gui:
+            server_thread = ServerThread(server)
+            server_thread.start()
+
+            from PyQt5 import QtCore, QtGui, QtQuick
+            app = QtGui.QGuiApplication(sys.argv)
+            view = QtQuick.QQuickView()
+            view.setResizeMode(QtQuick.QQuickView.SizeRootObjectToView)
+            view.setSource(QtCore.QUrl.fromLocalFile('mcd.qml'))
+            view.setTitle('Hamamatsu C7557-1 Control')
+            view.show()
+
+            app.lastWindowClosed.connect(server_thread.stop)
+            app.exec_()
+        else:
+            while True:
+                server.process(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # let the acquisition finish the current frame before exit
+        tid = driver.tid
+        if tid is not None:
+            driver.setParam('Acquire', 0)
+            tid.join()
+        if driver.frames is not None:
+            driver.frames.close()
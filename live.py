@@ -2,11 +2,16 @@
 """
 Live view of Hamamatsu MCD image via EPICS
 """
+import threading
+import time
+
 import numpy
 import pyqtgraph
 from PyQt5 import QtCore, QtWidgets
 from epicsPV import epicsPV
 
+from shmframe import FrameReader, FrameRingClosed
+
 class MCDImages():
     """
     MCD Live Images via EPICS, assuming the same interface as areaDetector NDPluginStdArrays
@@ -53,13 +58,72 @@ class MCDImages():
         self.image_listener(self.image)
 
 
+class MCDSharedImages():
+    """
+    MCD Live Images via shared memory, for viewers on the IOC host started with --shm
+    """
+
+    def __init__(self, name):
+        self.image_listener = None
+        self.image = None
+
+        self.name = name
+        self.reader = FrameReader(name)
+        self.thread = threading.Thread(target=self._poll, daemon=True)
+        self.thread.start()
+
+    def add_image_listener(self, image_listener):
+        """
+        subscribe for new image event
+        """
+        self.image_listener = image_listener
+
+        if self.image is not None:
+            self.image_listener(self.image)
+
+    def _poll(self):
+        frame_id = 0
+        while True:
+            try:
+                frame = self.reader.wait(frame_id)
+            except FrameRingClosed:
+                # the IOC has gone, attach to the ring of its successor
+                self.reader.close()
+                self.reader = self._attach()
+                frame_id = 0
+                continue
+            frame_id = frame.frame_id
+
+            # the image is handed over to the GUI thread, so detach it from the ring
+            array = numpy.array(frame.data)
+            current = self.reader.is_current(frame)
+            # the view pins the segment, which must be released on reattach
+            del frame
+            if not current:
+                continue
+
+            if array.ndim == 2:
+                array.shape += (1,)
+            self.image = array
+
+            if self.image_listener is not None:
+                self.image_listener(self.image)
+
+    def _attach(self):
+        while True:
+            try:
+                return FrameReader(self.name)
+            except (FileNotFoundError, ValueError):
+                time.sleep(1)
+
+
 class MCDImagesLiveViewer(QtWidgets.QMainWindow):
     """
     Main window
     """
     imageUpdated = QtCore.pyqtSignal(numpy.ndarray)
 
-    def __init__(self, prefix):
+    def __init__(self, prefix, shm=None):
         super(MCDImagesLiveViewer, self).__init__()
 
         self.imageView = pyqtgraph.ImageView(self)
@@ -67,7 +131,10 @@ class MCDImagesLiveViewer(QtWidgets.QMainWindow):
         self.setCentralWidget(self.imageView)
         self.imageUpdated.connect(self._update_image)
 
-        self.images = MCDImages(prefix)
+        if shm:
+            self.images = MCDSharedImages(shm)
+        else:
+            self.images = MCDImages(prefix)
         self.images.add_image_listener(self._new_image)
 
     def _new_image(self, image):
@@ -83,10 +150,12 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Hamamatsu MCD Live View')
     parser.add_argument('--prefix', default='iMott:',
                     help='EPICS PVs prefix')
+    parser.add_argument('--shm', metavar='NAME',
+                    help='read images from shared memory NAME instead of EPICS')
     args = parser.parse_args()
 
     app = QtWidgets.QApplication(sys.argv)
-    win = MCDImagesLiveViewer(args.prefix)
+    win = MCDImagesLiveViewer(args.prefix, args.shm)
     win.setWindowTitle('Hamamatsu C7557-1 Live View')
     win.resize(800, 600)
     win.show()
@@ -0,0 +1,418 @@
+"""
+Shared memory frame ring for consumers on the IOC host
+
+The writer publishes each frame into a named shared memory segment, laid out as
+a global header, followed by one header per slot and then the slot data::
+
+    | header | slot header 0 ... n-1 | slot data 0 | ... | slot data n-1 |
+
+Frame N goes to slot N % n. Each slot header carries a sequence counter, which
+is odd while the slot is being written and even once it is complete. A reader
+takes the counter before and after looking at the slot, and retries when they
+differ, so frames are never seen half written. The data is handed out as a
+numpy view onto the segment, i.e. without copy.
+
+When the writer closes, it clears the magic in the header before removing the
+segment, so that readers still attached can tell and attach to a new one. In
+case the writer did not get to close, readers also check that the writer
+process is alive and that the name still refers to the segment they attached.
+"""
+import collections
+import os
+import threading
+import time
+
+import numpy
+from multiprocessing import shared_memory, resource_tracker
+
+MAGIC = b'MCDFRAME'
+VERSION = 1
+
+HEADER_DTYPE = numpy.dtype({
+    'names':   ['magic', 'version', 'nslots', 'slot_size', 'frame_id', 'pid'],
+    'formats': ['S8', '<u4', '<u4', '<u8', '<u8', '<u4'],
+    'offsets': [0, 8, 12, 16, 24, 32],
+    'itemsize': 64,
+})
+
+SLOT_DTYPE = numpy.dtype({
+    'names':   ['seq', 'frame_id', 'timestamp', 'ndim', 'dtype', 'shape'],
+    'formats': ['<u8', '<u8', '<f8', '<u4', 'S8', ('<u8', 3)],
+    'offsets': [0, 8, 16, 24, 28, 40],
+    'itemsize': 64,
+})
+
+# names of the segments created by this process
+_created = set()
+
+Frame = collections.namedtuple('Frame', ['frame_id', 'timestamp', 'data', 'seq'])
+
+
+class FrameRingClosed(Exception):
+    """
+    The writer has closed the frame ring, or has gone without closing it.
+    """
+
+
+def _layout(buf, nslots, slot_size):
+    """
+    map the header, slot headers and slot data onto the shared buffer
+    """
+    header = numpy.ndarray((), HEADER_DTYPE, buf, 0)
+    slots = numpy.ndarray((nslots,), SLOT_DTYPE, buf, HEADER_DTYPE.itemsize)
+    offset = HEADER_DTYPE.itemsize + nslots * SLOT_DTYPE.itemsize
+    data = [numpy.ndarray((slot_size,), numpy.uint8, buf, offset + i * slot_size)
+            for i in range(nslots)]
+    return header, slots, data
+
+
+class FrameWriter(object):
+    """
+    Create the shared memory segment and publish frames into it.
+
+    :param str name: shared memory name, it appears as /dev/shm/<name> on Linux
+    :param int nslots: number of frames kept in the ring
+    :param int slot_size: maximum frame size in bytes
+    """
+    def __init__(self, name, nslots=4, slot_size=800000):
+        # keep the slot data cache line aligned
+        slot_size = (slot_size + 63) // 64 * 64
+        size = HEADER_DTYPE.itemsize + nslots * (SLOT_DTYPE.itemsize + slot_size)
+
+        self.name = name
+        self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        _created.add(name)
+        self.header, self.slots, self.data = _layout(self.shm.buf, nslots, slot_size)
+
+        self.slots[:] = 0
+        self.header['version'] = VERSION
+        self.header['nslots'] = nslots
+        self.header['slot_size'] = slot_size
+        self.header['frame_id'] = 0
+        self.header['pid'] = os.getpid()
+        # readers check the magic last, so the rest of the header must be ready
+        self.header['magic'] = MAGIC
+
+        self.frame_id = 0
+        # serialize write and close
+        self.lock = threading.Lock()
+
+    def check(self, image):
+        """
+        Check that the image fits into a slot.
+
+        :param image: image array
+        :raises ValueError: if the image cannot be published
+        """
+        if image.dtype.kind not in 'biufc':
+            raise ValueError('frame of %s type is not numeric' % image.dtype)
+        if len(image.dtype.str) > SLOT_DTYPE['dtype'].itemsize:
+            raise ValueError('frame type %s cannot be described' % image.dtype.str)
+        if image.ndim > 3:
+            raise ValueError('frame has more than 3 dimensions')
+        if image.nbytes > len(self.data[0]):
+            raise ValueError('frame of %d bytes exceeds slot size %d' %
+                             (image.nbytes, len(self.data[0])))
+
+    def write(self, image, timestamp=None):
+        """
+        Publish one frame.
+
+        :param image: image array, up to 3 dimensions
+        :param float timestamp: frame time in seconds since the epoch, default now
+        :return: frame id assigned, counting from 1
+        :raises ValueError: if the image cannot be published or the writer is closed
+        """
+        image = numpy.ascontiguousarray(image)
+        with self.lock:
+            if self.header is None:
+                raise ValueError('frame ring %s is closed' % self.name)
+            self.check(image)
+
+            self.frame_id += 1
+            index = self.frame_id % len(self.slots)
+            slot = self.slots[index]
+            seq = int(slot['seq'])
+
+            slot['seq'] = seq + 1
+            try:
+                self.data[index][:image.nbytes] = image.reshape(-1).view(numpy.uint8)
+                slot['frame_id'] = self.frame_id
+                slot['timestamp'] = time.time() if timestamp is None else timestamp
+                slot['ndim'] = image.ndim
+                slot['dtype'] = image.dtype.str.encode()
+                slot['shape'] = list(image.shape) + [0] * (3 - image.ndim)
+            except:
+                # the slot data is garbage now, so it must not match any frame id
+                slot['frame_id'] = 0
+                raise
+            finally:
+                slot['seq'] = seq + 2
+            del slot
+
+            self.header['frame_id'] = self.frame_id
+            return self.frame_id
+
+    def close(self):
+        """
+        Detach from and remove the shared memory segment.
+        """
+        with self.lock:
+            if self.header is None:
+                return
+            # tell the attached readers
+            self.header['magic'] = b''
+            # numpy views must be gone before the buffer can be released
+            self.header = self.slots = self.data = None
+            self.shm.close()
+            self.shm.unlink()
+            _created.discard(self.name)
+
+
+class FrameReader(object):
+    """
+    Attach to the shared memory segment created by :class:`FrameWriter`.
+
+    :param str name: shared memory name
+    :raises FileNotFoundError: if the segment does not exist
+    :raises ValueError: if the segment is not an open frame ring
+    """
+    def __init__(self, name):
+        # the resource tracker would otherwise remove the segment as this process exits
+        try:
+            self.shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # Python < 3.13, the tracker entry is shared with the writer if it is in this process
+            self.shm = shared_memory.SharedMemory(name)
+            if name not in _created:
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+        header = numpy.ndarray((), HEADER_DTYPE, self.shm.buf, 0)
+        if header['magic'] != MAGIC or header['version'] != VERSION:
+            del header
+            self.shm.close()
+            raise ValueError('%s is not a frame ring of version %d' % (name, VERSION))
+
+        self.name = name
+        self.pid = int(header['pid'])
+        self.header, self.slots, self.data = _layout(self.shm.buf,
+                int(header['nslots']), int(header['slot_size']))
+
+        # identify the segment, to tell whether its name is reused later
+        self.path = None
+        if os.path.isdir('/dev/shm'):
+            self.path = os.path.join('/dev/shm', self.shm.name.lstrip('/'))
+            stat = os.fstat(self.shm._fd)
+            self.inode = (stat.st_dev, stat.st_ino)
+
+    def closed(self):
+        """
+        Whether the writer has closed the frame ring, or has gone without closing it.
+        """
+        if self.header['magic'] != MAGIC:
+            return True
+
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            # alive, only owned by another user
+            pass
+
+        if self.path is not None:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return True
+            if (stat.st_dev, stat.st_ino) != self.inode:
+                return True
+
+        return False
+
+    def latest(self, timeout=1.0):
+        """
+        Get the most recent frame.
+
+        The frame data is a view onto the shared memory. It stays intact until
+        the writer comes round to the same slot again, see :meth:`is_current`.
+
+        :param float timeout: maximum time to wait for a consistent read in seconds
+        :return: the latest frame, or None if none has been written yet or on timeout
+        :rtype: Frame
+        :raises FrameRingClosed: if the writer has closed the frame ring
+        """
+        deadline = time.time() + timeout
+        while True:
+            if self.closed():
+                raise FrameRingClosed()
+            frame_id = int(self.header['frame_id'])
+            if frame_id == 0:
+                return None
+            frame = self.read(frame_id, max(deadline - time.time(), 0))
+            if frame is not None:
+                return frame
+            if time.time() > deadline:
+                return None
+
+    def read(self, frame_id, timeout=1.0, interval=0.001):
+        """
+        Get the frame with the given id.
+
+        :param int frame_id: frame id
+        :param float timeout: maximum time to wait for a consistent read in seconds
+        :param float interval: retry interval in seconds
+        :return: the frame, or None if it has been overwritten, not yet written or on timeout
+        :rtype: Frame
+        """
+        deadline = time.time() + timeout
+        index = frame_id % len(self.slots)
+        slot = self.slots[index]
+        while True:
+            seq = int(slot['seq'])
+            if seq % 2 == 0:
+                if slot['frame_id'] != frame_id:
+                    return None
+                ndim = int(slot['ndim'])
+                shape = tuple(int(n) for n in slot['shape'][:ndim])
+                dtype = slot['dtype']
+                timestamp = float(slot['timestamp'])
+                if int(slot['seq']) == seq:
+                    break
+            # the writer is in the middle of this slot
+            if time.time() > deadline:
+                return None
+            time.sleep(interval)
+
+        dtype = numpy.dtype(dtype.decode())
+        nbytes = dtype.itemsize * int(numpy.prod(shape))
+        data = self.data[index][:nbytes].view(dtype).reshape(shape)
+        data.flags.writeable = False
+        return Frame(frame_id, timestamp, data, seq)
+
+    def wait(self, frame_id=0, timeout=None, interval=0.001):
+        """
+        Wait for a frame newer than the given frame id.
+
+        :param int frame_id: last frame id seen
+        :param float timeout: maximum time to wait in seconds, default forever
+        :param float interval: polling interval in seconds
+        :return: the latest frame, or None on timeout
+        :rtype: Frame
+        :raises FrameRingClosed: if the writer has closed the frame ring
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if self.closed():
+                raise FrameRingClosed()
+            if self.header['frame_id'] > frame_id:
+                frame = self.latest(1.0 if deadline is None else max(deadline - time.time(), 0))
+                if frame is not None and frame.frame_id > frame_id:
+                    return frame
+            if deadline is not None and time.time() > deadline:
+                return None
+            time.sleep(interval)
+
+    def is_current(self, frame):
+        """
+        Check whether the frame data has not been overwritten since it was read.
+        Call this after having used the data view.
+
+        :param Frame frame: frame returned by :meth:`read` or :meth:`latest`
+        """
+        return int(self.slots[frame.frame_id % len(self.slots)]['seq']) == frame.seq
+
+    def close(self):
+        """
+        Detach from the shared memory segment. Frame views must not be used afterwards.
+        """
+        self.header = self.slots = self.data = None
+        self.shm.close()
+
+
+if __name__ == '__main__':
+    # self test, writer and reader in one process
+    import os
+    name = 'shmframe_test_%d' % os.getpid()
+    writer = FrameWriter(name, nslots=2, slot_size=1024)
+    reader = FrameReader(name)
+
+    assert reader.latest() is None
+    assert reader.wait(timeout=0.01) is None
+
+    image = numpy.arange(12, dtype='<u2').reshape(3, 4)
+    assert writer.write(image, timestamp=1.5) == 1
+    frame = reader.latest()
+    assert frame.frame_id == 1 and frame.timestamp == 1.5
+    assert frame.data.dtype == image.dtype and (frame.data == image).all()
+    assert reader.is_current(frame)
+
+    # the ring wraps around after two frames
+    writer.write(numpy.zeros((2, 2, 2), numpy.float32))
+    assert reader.is_current(frame)
+    writer.write(image)
+    assert not reader.is_current(frame)
+    assert reader.read(1) is None
+    assert reader.wait(2).frame_id == 3
+
+    # rejected frames leave the ring untouched
+    for bad in [numpy.zeros(2, 'O'), numpy.zeros(2, 'U20'), numpy.zeros((1, 1, 1, 1)),
+                numpy.zeros(2048, numpy.uint8)]:
+        try:
+            writer.write(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('%r accepted' % bad)
+    assert (reader.slots['seq'] % 2 == 0).all()
+    assert writer.write(image) == 4
+
+    # a slot left in the middle of a write does not block readers
+    writer.slots[0]['seq'] += 1
+    start = time.time()
+    assert reader.read(4, timeout=0.05) is None
+    assert reader.latest(timeout=0.05) is None
+    assert time.time() - start < 1
+    writer.slots[0]['seq'] += 1
+
+    # readers notice when the writer goes away without closing
+    import subprocess
+    import sys
+    crash = name + '_crash'
+    code = ('import sys, time\n'
+            'from shmframe import FrameWriter\n'
+            'writer = FrameWriter(%r)\n'
+            'print(flush=True)\n'
+            'time.sleep(60)\n' % crash)
+    process = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+    process.stdout.readline()
+    crashed = FrameReader(crash)
+    assert not crashed.closed()
+    process.kill()
+    process.wait()
+    try:
+        crashed.wait(timeout=5)
+    except FrameRingClosed:
+        pass
+    else:
+        raise AssertionError('dead writer not detected')
+    crashed.close()
+
+    # readers notice when the writer closes
+    del frame
+    writer.close()
+    try:
+        reader.wait()
+    except FrameRingClosed:
+        pass
+    else:
+        raise AssertionError('closed ring not detected')
+    try:
+        writer.write(image)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('write after close accepted')
+    reader.close()
+    print('OK')